@@ -1,9 +1,55 @@
 """Entry point"""
 
+import argparse
+from multiprocessing import Process
+
 from src.server.server import Server
 from src.tools.constant import IP_SERVER, PORT_SERVER
 from src.tools.logger import setup_logger
 
+
+def run_worker(host: str, port: int) -> None:
+    """
+    Run a server sharing its port with the other workers
+
+    Args:
+        host (str): hostname of the server
+        port (int): port of the server
+    """
+    listener = setup_logger("server.log")
+    try:
+        Server(host, port, reuse_port=True).server_thread.join()
+    finally:
+        # atexit handlers do not run in multiprocessing children
+        listener.stop()
+
+
 if __name__ == "__main__":
-    setup_logger("server.log")
-    Server(IP_SERVER, PORT_SERVER)
+    parser = argparse.ArgumentParser(description="TCP server for Messenger app")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of server processes sharing the port. Workers share no state: "
+        "broadcasts and direct messages only reach the clients of the same worker "
+        "(the API still stores the messages) and CONN_NB counts the clients of "
+        "each worker, not the total",
+    )
+    args = parser.parse_args()
+
+    if args.workers <= 1:
+        setup_logger("server.log")
+        Server(IP_SERVER, PORT_SERVER)
+    else:
+        workers = [
+            Process(
+                target=run_worker,
+                args=(IP_SERVER, PORT_SERVER),
+                name=f"Worker {index}",
+            )
+            for index in range(args.workers)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
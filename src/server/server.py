@@ -1,30 +1,158 @@
 """Server class"""
 
+import errno
 import logging
+import selectors
 import socket
 import sys
 import time
-from threading import Thread
-from typing import Dict, Optional, Union
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache, partial
+from queue import Empty, SimpleQueue
+from threading import Event, Lock, Thread
+from typing import Callable, Dict, Optional, Set, Tuple, Union
 
 from src.tools.backend import Backend
-from src.tools.commands import Commands
+from src.tools.commands import CMD_BY_INT, Commands
 from src.tools.constant import IP_API, PORT_API
 
+BUFSIZE = 4096
+RXBUF_SIZE = 8192
+RXBUF_MAX_SIZE = 1 << 20
+SNDBUF_SIZE = 65536
+RCVBUF_SIZE = 32768
+TXBUF_MAX_SIZE = 1 << 20
+ACCEPT_BACKOFF = 0.1
+ACCEPT_BACKOFF_MAX = 5.0
+REACTION_FLUSH_DELAY = 0.05
+
+ParsedPayload = Tuple[str, str, str, Optional[str]]
+Frame = Tuple[bytes, ...]
+
+_HDR_BYTES: Dict[Commands, bytes] = {c: c.value.to_bytes(1, "big") for c in Commands}
+_SERVER_PREFIX = b"server:"
+_NL = b"\n"
+# Not available on Windows
+_HAS_SENDMSG = hasattr(socket.socket, "sendmsg")
+# Accept errors of the whole process, the others only concern one connection
+_ACCEPT_RESOURCE_ERRORS = (errno.EMFILE, errno.ENFILE, errno.ENOBUFS, errno.ENOMEM)
+
+
+def encode_frame(
+    header: Commands, payload: str, is_from_server: Optional[bool] = False
+) -> Frame:
+    """
+    Encode a frame to be sent to the clients, the parts are not concatenated
+
+    Args:
+        header (Commands): header of the cmd
+        payload (str): payload of the cmd
+        is_from_server (Optional[bool], optional): cmd from server. Defaults to False.
+
+    Returns:
+        Frame: the encoded parts of the frame
+    """
+    if is_from_server:
+        return _HDR_BYTES[header], _SERVER_PREFIX, payload.encode("utf-8"), _NL
+    return _HDR_BYTES[header], payload.encode("utf-8"), _NL
+
+
+@lru_cache(maxsize=64)
+def _conn_nb_frame(conn_nb: int) -> Frame:
+    """
+    Encode the frame sent to the clients when the number of connections changes
+
+    Args:
+        conn_nb (int): number of connected clients
+
+    Returns:
+        Frame: the encoded parts of the frame
+    """
+    return encode_frame(Commands.CONN_NB, str(conn_nb), is_from_server=True)
+
+
+def _parse(payload: str) -> ParsedPayload:
+    """
+    Parse the payload of a client frame
+
+    Args:
+        payload (str): payload formatted as sender:receiver:message[:response_id],
+            response_id being numeric
 
+    Returns:
+        ParsedPayload: sender, receiver, message and response_id
+    """
+    parts = payload.split(":", 3)
+    # Usernames are sanitized here only, the other methods use these values
+    sender = parts[0].replace(" ", "")
+    receiver = parts[1].replace(" ", "")
+    message = parts[2] if len(parts) > 2 else ""
+    response_id = None
+    if len(parts) > 3:
+        # Colons after the message are part of it unless a response ID follows
+        if parts[3].isascii() and parts[3].isdecimal():
+            response_id = parts[3]
+        else:
+            message = f"{message}:{parts[3]}"
+    return sender, receiver, message, response_id
+
+
+# pylint: disable=too-many-instance-attributes
 class Server:
     """
     This class handle server connection, send and receive data from clients in TCP
     """
 
-    def __init__(self, host: str, port: int, conn_nb: int = 2) -> None:
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        conn_nb: int = socket.SOMAXCONN,
+        reuse_port: Optional[bool] = False,
+    ) -> None:
         self.backend = Backend(IP_API, PORT_API)
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            # Several processes listen on the same port, the kernel spreads the
+            # incoming connections between them
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         self.sock.bind((host, port))
         self.sock.listen(conn_nb)
+        self.sock.setblocking(False)
+        self.sel = selectors.DefaultSelector()
+        self.sel.register(self.sock, selectors.EVENT_READ, self._accept)
         self.conn_dict: Dict[str, socket.socket] = {}
         self.user_dict: Dict[str, str] = {}
-        Thread(target=self.launch, name="Server thread").start()
+        self.addr_to_user: Dict[str, str] = {}
+        self._rxbuf: Dict[str, bytearray] = {}
+        self._rxstart: Dict[str, int] = {}
+        self._rxend: Dict[str, int] = {}
+        self._txbuf: Dict[socket.socket, bytearray] = {}
+        self._aborted: Set[socket.socket] = set()
+        self._accept_backoff = 0.0
+        self._accept_resume: Optional[float] = None
+        self._pending: Dict[str, deque] = {}
+        self._in_flight: Dict[str, Future] = {}
+        # API calls are done by workers, their results are handled by the
+        # server thread once it is woken up through the socket pair
+        self.api_executor = ThreadPoolExecutor(max_workers=8)
+        self._ready: SimpleQueue = SimpleQueue()
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._wakeup_w.setblocking(False)
+        self.sel.register(self._wakeup_r, selectors.EVENT_READ, self._run_ready)
+        # Only the last reaction number of a message is sent to the API
+        self._pending_reactions: Dict[str, str] = {}
+        self._reaction_lock = Lock()
+        self._reaction_event = Event()
+        self._closing = Event()
+        Thread(
+            target=self._flush_reactions, name="Reaction thread", daemon=True
+        ).start()
+        self.server_thread = Thread(target=self.launch, name="Server thread")
+        self.server_thread.start()
 
         self.hello_world(host, port)
 
@@ -40,21 +168,26 @@ class Server:
 
     def launch(self) -> None:
         """
-        Launch the server
+        Launch the server, every read event is dispatched by the selector
+        to the callback registered with the socket
         """
-        time_sleep = 0.1
-
         try:
-            while "Server connected":
-                conn, addr = self.sock.accept()
-                time.sleep(time_sleep)
-                conn_thread = Thread(
-                    target=self.create_connection,
-                    args=(conn, addr),
-                    name=f"{addr} thread",
-                    daemon=True,
-                )
-                conn_thread.start()
+            while True:
+                timeout = None
+                if self._accept_resume is not None:
+                    timeout = max(self._accept_resume - time.monotonic(), 0)
+                for key, mask in self.sel.select(timeout):
+                    # The socket may have been closed by a previous callback
+                    if mask & selectors.EVENT_WRITE and key.fileobj.fileno() != -1:
+                        self._on_writable(key.fileobj)
+                    if mask & selectors.EVENT_READ and key.fileobj.fileno() != -1:
+                        key.data(key.fileobj)
+                if (
+                    self._accept_resume is not None
+                    and time.monotonic() >= self._accept_resume
+                ):
+                    self._accept_resume = None
+                    self.sel.register(self.sock, selectors.EVENT_READ, self._accept)
         except (KeyboardInterrupt, ConnectionAbortedError):
             self.close_connection()
 
@@ -65,153 +198,439 @@ class Server:
         """
         # close the socket
         logging.info("Server disconnected")
+        # The reaction thread sends the last pending reactions then stops
+        self._closing.set()
+        self._reaction_event.set()
+        self.api_executor.shutdown(wait=False)
+        self.sel.close()
         self.sock.close()
         sys.exit(0)
 
-    def read_data(self, conn: socket) -> tuple:
+    def _call_soon(self, callback: Callable) -> None:
         """
-        Read raw data from the client
+        Schedule a callback in the server thread, can be called from any thread
 
         Args:
-            conn (socket): socket of the client
-        Returns:
-            tuple: return header and payload
-        """
-        raw_data: bytes = b""
-        header, payload = None, None
-        while "Empty message":
-            chunk = conn.recv(1)
-            if chunk not in [b"\n", b""]:
-                raw_data += chunk
-            else:
+            callback (Callable): callback without argument
+        """
+        self._ready.put(callback)
+        try:
+            self._wakeup_w.send(b"\0")
+        except BlockingIOError:
+            # The server thread is already woken up
+            pass
+
+    def _run_ready(self, sock: socket) -> None:
+        """
+        Run the callbacks scheduled by _call_soon
+
+        Args:
+            sock (socket): read end of the wakeup socket pair
+        """
+        try:
+            while sock.recv(BUFSIZE):
+                pass
+        except BlockingIOError:
+            pass
+
+        while True:
+            try:
+                callback = self._ready.get_nowait()
+            except Empty:
                 break
-        if raw_data:
-            header, payload = raw_data[0], raw_data[1:].decode("utf-8")
-        return header, payload
+            callback()
 
-    def send_data(
-        self,
-        conn: socket,
-        header: Commands,
-        payload: str,
-        is_from_server: Optional[bool] = False,
-    ) -> None:
+    def _accept(self, sock: socket) -> None:
         """
-        Send data to the client
+        Accept new clients and register them in the selector
 
         Args:
-            conn (socket): connection with the client
-            header (Commands): header of the cmd
-            payload (str): payload of the cmd
-            is_from_server (Optional[bool], optional): cmd from server. Defaults to False.
+            sock (socket): listening socket of the server
         """
-        message = f"server:{payload}\n" if is_from_server else f"{payload}\n"
+        # Accept every pending connection, not only one per event
+        while True:
+            try:
+                conn, addr = sock.accept()
+            except BlockingIOError:
+                return
+            except OSError as error:
+                if error.errno in _ACCEPT_RESOURCE_ERRORS:
+                    self._pause_accept(error)
+                    return
+                # Only this connection failed, e.g. reset before being accepted
+                logging.warning("Accept failed: %s", error)
+                continue
+            self._accept_backoff = 0.0
+            conn.setblocking(False)
+            # Small chat messages must not be delayed by Nagle's algorithm
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SNDBUF_SIZE)
+            conn.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RCVBUF_SIZE)
+            # Registered first, send_data may watch the socket for write events
+            self.sel.register(
+                conn, selectors.EVENT_READ, partial(self._on_readable, addr)
+            )
+            self.handle_new_connection(addr, conn)
+
+            logging.debug("Connected by %s", addr)
+
+    def _pause_accept(self, error: OSError) -> None:
+        """
+        Stop accepting clients for a while when no file descriptor or memory is
+        left, the delay doubles while accept keeps failing
 
-        bytes_message = header.value.to_bytes(1, "big") + message.encode("utf-8")
-        conn.send(bytes_message)
+        Args:
+            error (OSError): error raised by accept
+        """
+        self._accept_backoff = min(
+            self._accept_backoff * 2 or ACCEPT_BACKOFF, ACCEPT_BACKOFF_MAX
+        )
+        logging.warning("%s, accept paused for %ss", error, self._accept_backoff)
+        self.sel.unregister(self.sock)
+        self._accept_resume = time.monotonic() + self._accept_backoff
 
-    def create_connection(self, conn: socket, addr: str) -> None:
+    def _on_readable(self, addr: str, conn: socket) -> None:
         """
-        Create a new connection
+        Receive available bytes from the client and handle every complete frame
 
         Args:
-            conn (socket): Socket of the client
             addr (str): address of the client
+            conn (socket): socket of the client
         """
-        self.handle_new_connection(addr, conn)
+        buf = self._rxbuf[addr]
+        end = self._rxend[addr]
+        if end == len(buf):
+            # A single frame is bigger than the buffer
+            if len(buf) >= RXBUF_MAX_SIZE:
+                logging.warning("Frame from %s exceeds %s bytes", addr, len(buf))
+                self._display_disconnection(conn, addr)
+                return
+            buf.extend(bytes(len(buf)))
 
-        logging.debug("Connected by %s", addr)
+        try:
+            with memoryview(buf)[end:] as view:
+                nbytes = conn.recv_into(view)
+        except BlockingIOError:
+            return
+        except OSError as error:
+            # Any socket error only disconnects this client
+            logging.debug("Receive from %s failed: %s", addr, error)
+            nbytes = 0
 
-        # Receive the data in small chunks and retransmit it
         try:
+            if not nbytes:
+                raise ConnectionAbortedError
+            self._rxend[addr] = end + nbytes
             while True:
-                header, payload = self.read_data(conn)
-                if not payload:
-                    raise ConnectionAbortedError
+                # A bad frame is logged and skipped, the next frames are handled
+                try:
+                    if not (frame := self.read_data(addr)):
+                        break
+                    self.handle_frame(addr, *frame)
+                except (KeyError, IndexError, ValueError) as error:
+                    logging.error("Bad frame from %s: %r", addr, error)
+        except (ConnectionAbortedError, ConnectionResetError, BrokenPipeError):
+            self._display_disconnection(conn, addr)
+            return
 
-                receiver = self.__match_username_and_address(addr, payload)
+        self._compact_rxbuf(addr)
 
-                if message_id := self.send_message_to_backend(header, payload):
-                    payload = f"{message_id}:{payload}"
+    def read_data(self, addr: str) -> Optional[tuple]:
+        """
+        Read the next frame from the receive buffer of the client, the bytes of
+        the frame are released by _compact_rxbuf
 
-                # If receiver is home, send messages to all users
-                if receiver == "home":
-                    for socket_ in self.conn_dict.values():
-                        self.send_data(socket_, Commands(header), payload)
-                    continue
+        Args:
+            addr (str): address of the client
+        Returns:
+            Optional[tuple]: return header and payload, None if no complete frame
+        """
+        buf = self._rxbuf[addr]
+        start = self._rxstart[addr]
+        idx = buf.find(b"\n", start, self._rxend[addr])
+        if idx < 0:
+            return None
+
+        self._rxstart[addr] = idx + 1
+        if idx == start:
+            return None, None
+        # The payload is decoded from the buffer without intermediate bytes
+        with memoryview(buf)[start:idx] as view:
+            return view[0], str(view[1:], "utf-8")
+
+    def _compact_rxbuf(self, addr: str) -> None:
+        """
+        Move the bytes of the incomplete frame to the start of the receive buffer,
+        once all the complete frames have been read
+
+        Args:
+            addr (str): address of the client
+        """
+        start = self._rxstart[addr]
+        if not start:
+            return
+
+        buf = self._rxbuf[addr]
+        remaining = self._rxend[addr] - start
+        buf[:remaining] = buf[start : start + remaining]
+        self._rxstart[addr] = 0
+        self._rxend[addr] = remaining
+        if not remaining and len(buf) > RXBUF_SIZE:
+            # Release the memory used by a big frame
+            del buf[RXBUF_SIZE:]
+
+    def send_data(self, conn: socket, frame: Frame) -> None:
+        """
+        Send data to the client
+
+        Args:
+            conn (socket): connection with the client
+            frame (Frame): frame encoded with encode_frame
+        """
+        if conn in self._aborted:
+            return
+
+        # Keep the order of the frames if some bytes are waiting to be sent
+        if pending := self._txbuf.get(conn):
+            for part in frame:
+                pending += part
+            # A client which does not read must not exhaust the server memory
+            if len(pending) > TXBUF_MAX_SIZE:
+                self._abort_client(conn, "transmit buffer full")
+            return
 
-                if receiver in self.user_dict:
-                    # Send to the receiver
-                    self.send_data(
-                        self.conn_dict[self.user_dict[receiver]],
-                        Commands(header),
-                        payload,
+        try:
+            # The kernel gathers the parts, no concatenated copy is needed
+            if _HAS_SENDMSG:
+                sent = conn.sendmsg(frame)
+            else:
+                sent = conn.send(b"".join(frame))
+        except BlockingIOError:
+            sent = 0
+        except OSError as error:
+            self._abort_client(conn, error)
+            return
+
+        size = sum(len(part) for part in frame)
+        if sent < size:
+            self._txbuf[conn] = bytearray(b"".join(frame)[sent:])
+            self.sel.modify(
+                conn,
+                selectors.EVENT_READ | selectors.EVENT_WRITE,
+                self.sel.get_key(conn).data,
+            )
+
+    def _on_writable(self, conn: socket) -> None:
+        """
+        Send the bytes waiting in the transmit buffer of the client
+
+        Args:
+            conn (socket): socket of the client
+        """
+        pending = self._txbuf.get(conn)
+        if pending is None:
+            # Aborted by a previous callback of the same select batch
+            return
+        try:
+            del pending[: conn.send(pending)]
+        except BlockingIOError:
+            return
+        except OSError as error:
+            self._abort_client(conn, error)
+            return
+
+        if not pending:
+            self._txbuf.pop(conn)
+            self.sel.modify(conn, selectors.EVENT_READ, self.sel.get_key(conn).data)
+
+    def _abort_client(self, conn: socket, reason: Union[str, Exception]) -> None:
+        """
+        Stop writing to a client after a socket error or when it does not read,
+        the socket is shut down so the read path disconnects the client on the
+        next event of the selector
+
+        Args:
+            conn (socket): socket of the client
+            reason (Union[str, Exception]): reason of the abort, logged
+        """
+        logging.warning("Client aborted, %s: %s", reason, conn)
+        self._aborted.add(conn)
+        if self._txbuf.pop(conn, None) is not None:
+            self.sel.modify(conn, selectors.EVENT_READ, self.sel.get_key(conn).data)
+        try:
+            conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            # The socket is already unusable, the selector reports it as readable
+            pass
+
+    def handle_frame(self, addr: str, header: int, payload: str) -> None:
+        """
+        Handle a frame received from a client and retransmit it
+
+        Args:
+            addr (str): address of the client
+            header (int): header of the frame
+            payload (str): payload of the frame
+        """
+        if not payload:
+            raise ConnectionAbortedError
+
+        parsed = _parse(payload)
+        receiver = parsed[1]
+        self._register_user(addr, parsed[0])
+        cmd = CMD_BY_INT[header]
+
+        # The API call must not block the server thread, frames of a client are
+        # retransmitted in the order they were received
+        if cmd != Commands.MESSAGE:
+            # Reactions are only recorded here, the reaction thread sends them
+            self.send_message_to_backend(cmd, parsed)
+            if addr not in self._pending:
+                self._fanout(addr, receiver, cmd, payload)
+                return
+        self._pending.setdefault(addr, deque()).append((receiver, cmd, payload, parsed))
+        if addr not in self._in_flight:
+            self._flush_pending(addr)
+
+    def _flush_pending(self, addr: str) -> None:
+        """
+        Retransmit the frames of a client in order, only one API call of a client
+        is in flight so the API stores its messages in the order they were sent
+
+        Args:
+            addr (str): address of the sender
+        """
+        pending = self._pending.get(addr)
+        while pending:
+            receiver, cmd, payload, parsed = pending[0]
+            if cmd == Commands.MESSAGE:
+                future = self._in_flight.get(addr)
+                if future is None:
+                    future = self.api_executor.submit(
+                        self.send_message_to_backend, cmd, parsed
                     )
-                # Send to the sender anyway
-                self.send_data(
-                    self.conn_dict[addr],
-                    Commands(header),
-                    payload,
-                )
-                logging.debug(
-                    "Client %s: >> header: %s payload: %s", addr, header, payload
-                )
+                    self._in_flight[addr] = future
+                    future.add_done_callback(
+                        lambda _: self._call_soon(partial(self._flush_pending, addr))
+                    )
+                    return
+                if not future.done():
+                    return
+                del self._in_flight[addr]
+                pending.popleft()
+                if error := future.exception():
+                    logging.error("API call failed for %s: %s", addr, error)
+                    continue
+                if message_id := future.result():
+                    payload = f"{message_id}:{payload}"
+            else:
+                pending.popleft()
+            self._fanout(addr, receiver, cmd, payload)
+        self._pending.pop(addr, None)
 
-        except (ConnectionAbortedError, ConnectionResetError, BrokenPipeError):
-            self._display_disconnection(conn, addr)
-        except KeyError as error:
-            logging.error(error)
+    def _fanout(self, addr: str, receiver: str, cmd: Commands, payload: str) -> None:
+        """
+        Retransmit a frame to its receiver and its sender, or to all the clients
 
-    def send_message_to_backend(self, header: int, payload: str) -> Union[None, str]:
+        Args:
+            addr (str): address of the sender
+            receiver (str): username of the receiver
+            cmd (Commands): header of the frame
+            payload (str): payload of the frame, prefixed by the message ID if any
+        """
+        frame = encode_frame(cmd, payload)
+
+        # If receiver is home, send messages to all users
+        if receiver == "home":
+            for socket_ in tuple(self.conn_dict.values()):
+                self.send_data(socket_, frame)
+            return
+
+        # Send to the receiver, if connected
+        if receiver_conn := self.conn_dict.get(self.user_dict.get(receiver)):
+            self.send_data(receiver_conn, frame)
+        # Send to the sender anyway, if still connected
+        if conn := self.conn_dict.get(addr):
+            self.send_data(conn, frame)
+
+        logging.debug("Client %s: >> header: %s payload: %s", addr, cmd, payload)
+
+    def send_message_to_backend(
+        self, cmd: Commands, parsed: ParsedPayload
+    ) -> Union[None, str]:
         """
         Send message to the API
 
         Args:
-            header (int): header of the message
-            payload (str): payload of the message
+            cmd (Commands): header of the message
+            parsed (ParsedPayload): payload parsed by _parse
         """
-        if Commands(header) == Commands.MESSAGE:
-            return self._send_string_message(payload)
-        if Commands(header) in [Commands.ADD_REACT, Commands.RM_REACT]:
-            self._update_reaction(payload)
+        if cmd == Commands.MESSAGE:
+            return self._send_string_message(parsed)
+        if cmd in [Commands.ADD_REACT, Commands.RM_REACT]:
+            self._update_reaction(parsed)
 
         return None
 
-    def _send_string_message(self, payload: str) -> str:
+    def _send_string_message(self, parsed: ParsedPayload) -> str:
         """
         Send string message to the API
 
         Args:
-            payload (str): payload
+            parsed (ParsedPayload): payload parsed by _parse
 
         Returns:
             str: message_id
         """
-        payload_list = payload.split(":")
-        sender, receiver, message = (
-            payload_list[0],
-            payload_list[1],
-            payload_list[2],
+        sender, receiver, message, response_id = parsed
+        response = self.backend.send_message(
+            sender, receiver, message, response_id or 0
         )
-        response_id = payload_list[3] if len(payload_list) == 4 else 0
-        receiver = receiver.replace(" ", "")
-        response = self.backend.send_message(sender, receiver, message, response_id)
 
         return response["message_id"]
 
-    def _update_reaction(self, payload: str) -> None:
+    def _update_reaction(self, parsed: ParsedPayload) -> None:
         """
         Add backend message to update reaction
 
         Args:
-            payload (str): payload
+            parsed (ParsedPayload): payload parsed by _parse
         """
-        payload_list = payload.split(":")
-        _, _, message = payload_list[0], payload_list[1], payload_list[2]
+        message = parsed[2]
         message_list = message.split(";")
         message_id, reaction_nb = message_list[0], message_list[1]
         logging.info(message)
-        self.backend.update_reaction_nb(message_id, reaction_nb)
+        with self._reaction_lock:
+            self._pending_reactions[message_id] = reaction_nb
+            self._reaction_event.set()
+
+    def _flush_reactions(self) -> None:
+        """
+        Send the pending reaction numbers to the API, the updates of a message
+        received during REACTION_FLUSH_DELAY are coalesced into one call. The calls
+        are made one after the other, so an older count never overwrites a newer one
+        """
+        while not self._closing.is_set():
+            self._reaction_event.wait()
+            self._closing.wait(REACTION_FLUSH_DELAY)
+            with self._reaction_lock:
+                self._reaction_event.clear()
+                reactions, self._pending_reactions = self._pending_reactions, {}
+            for message_id, reaction_nb in reactions.items():
+                # pylint: disable=broad-exception-caught
+                try:
+                    status = self.backend.update_reaction_nb(message_id, reaction_nb)
+                except Exception as error:
+                    logging.error(
+                        "Reaction update of message %s failed: %r", message_id, error
+                    )
+                    continue
+                if status != 200:
+                    logging.error(
+                        "Reaction update of message %s failed: status %s",
+                        message_id,
+                        status,
+                    )
 
     def handle_new_connection(self, addr: str, conn: socket) -> None:
         """
@@ -222,13 +641,11 @@ class Server:
             conn (_type_): _description_
         """
         self.conn_dict[addr] = conn
+        self._rxbuf[addr] = bytearray(RXBUF_SIZE)
+        self._rxstart[addr] = 0
+        self._rxend[addr] = 0
 
-        # Send nb of conn
-        message = str(len(self.conn_dict))
-
-        # Send to all connected clients
-        for socket_ in self.conn_dict.values():
-            self.send_data(socket_, Commands.CONN_NB, message, is_from_server=True)
+        self._send_conn_nb()
 
     def _display_disconnection(self, conn: socket, addr: str) -> None:
         """
@@ -239,39 +656,46 @@ class Server:
             addr (str): socket address of the client
         """
         logging.debug("Connection aborted by the client")
+        self.sel.unregister(conn)
         conn.close()
         self.conn_dict.pop(addr)
+        self._rxbuf.pop(addr, None)
+        self._rxstart.pop(addr, None)
+        self._rxend.pop(addr, None)
+        self._txbuf.pop(conn, None)
+        self._aborted.discard(conn)
 
         # Remove user from user_dict
-        for key, value in self.user_dict.items():
-            if value == addr:
-                self.user_dict.pop(key)
-                break
+        username = self.addr_to_user.pop(addr, None)
+        if username and self.user_dict.get(username) == addr:
+            self.user_dict.pop(username)
 
-        already_connected = len(self.conn_dict) >= 1
-        if already_connected:
-            for address, socket_ in self.conn_dict.items():
-                if address != addr:
-                    message = str(len(self.conn_dict))
-                    self.send_data(
-                        socket_,
-                        Commands.CONN_NB,
-                        message,
-                        is_from_server=True,
-                    )
+        self._send_conn_nb()
+
+    def _send_conn_nb(self) -> None:
+        """
+        Send the number of connections to all connected clients
+        """
+        frame = _conn_nb_frame(len(self.conn_dict))
+        # Iterate over a snapshot, conn_dict must not change during a broadcast
+        for socket_ in tuple(self.conn_dict.values()):
+            self.send_data(socket_, frame)
 
-    def __match_username_and_address(self, address: str, payload: str) -> None:
+    def _register_user(self, address: str, username: str) -> None:
         """
         Match the IP addresse with the username in db
 
         Args:
             address (str): address
-            payload (str): payload
+            username (str): username of the sender, already sanitized by _parse
         """
-        username, receiver = payload.split(":")[0], payload.split(":")[1]
-        receiver = receiver.replace(" ", "")
-        username = username.replace(" ", "")
+        # The sender is already known after its first message
+        previous = self.addr_to_user.get(address)
+        if previous == username:
+            return
         if username != "home":
+            # The previous name of this address must not point to it anymore
+            if previous and self.user_dict.get(previous) == address:
+                del self.user_dict[previous]
             self.user_dict[username] = address
-
-        return receiver
+            self.addr_to_user[address] = username
@@ -1,11 +1,13 @@
 """Module to communicate with the API"""
 
+import threading
 from typing import Optional, Union
 
 import requests
 
 # pylint: disable=no-name-in-module
 from PySide6.QtWidgets import QFileDialog, QMainWindow
+from requests.adapters import HTTPAdapter
 
 
 class Backend:
@@ -17,6 +19,30 @@ class Backend:
         self.parent = parent
         self.ip = ip
         self.port = port
+        # Endpoints are built once, not on every call
+        self._base = f"http://{ip}:{port}"
+        self._messages_url = self._base + "/messages/"
+        self._user_url = self._base + "/user/"
+        self._local = threading.local()
+
+    @property
+    def session(self) -> requests.Session:
+        """
+        Session of the calling thread, a requests.Session must not be shared
+        between threads. It reuses keep-alive connections to the API
+
+        Returns:
+            requests.Session: the session of the calling thread
+        """
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+            session.headers.update(
+                {"Accept": "application/json", "Connection": "keep-alive"}
+            )
+            self._local.session = session
+        return session
 
     def send_login_form(self, username: str, password: str) -> bool:
         """
@@ -29,9 +55,8 @@ class Backend:
         Returns:
             bool: True if the login is successful, False otherwise
         """
-        endpoint = f"http://{self.ip}:{self.port}/user/"
-        response = requests.get(
-            url=f"{endpoint}{username}?password={password}", timeout=10
+        response = self.session.get(
+            url=f"{self._user_url}{username}?password={password}", timeout=10
         )
         is_connected: bool = False
         if response.status_code == 200 and response.content:
@@ -50,10 +75,8 @@ class Backend:
         Returns:
             bool: True if the login status is successful, False otherwise
         """
-        endpoint = (
-            f"http://{self.ip}:{self.port}/user/{username}/?is_connected={status}"
-        )
-        response = requests.patch(url=endpoint, timeout=10)
+        endpoint = f"{self._user_url}{username}/?is_connected={status}"
+        response = self.session.patch(url=endpoint, timeout=10)
 
         return response.status_code == 200
 
@@ -68,10 +91,9 @@ class Backend:
         Returns:
             bool: True if the register is successful, False otherwise
         """
-        endpoint = f"http://{self.ip}:{self.port}/register"
+        endpoint = self._base + "/register"
         data = {"username": username, "password": password}
-        header = {"Accept": "application/json"}
-        response = requests.post(url=endpoint, headers=header, json=data, timeout=10)
+        response = self.session.post(url=endpoint, json=data, timeout=10)
         return response.status_code == 200
 
     def send_user_icon(
@@ -93,11 +115,11 @@ class Backend:
         )  # TODO: To remove from here
         if not path[0]:
             return None
-        endpoint = f"http://{self.ip}:{self.port}/user/{username}"
+        endpoint = self._user_url + username
 
         with open(path[0], "rb") as file:
             files = {"file": file}
-            response = requests.put(url=endpoint, files=files, timeout=10)
+            response = self.session.put(url=endpoint, files=files, timeout=10)
 
         return response.status_code == 200
 
@@ -111,8 +133,9 @@ class Backend:
         Returns:
             Union[bool, bytes]: the user icon if the request is successful, False otherwise
         """
-        endpoint = f"http://{self.ip}:{self.port}/user/"
-        response = requests.get(url=f"{endpoint}{username}/picture", timeout=10)
+        response = self.session.get(
+            url=f"{self._user_url}{username}/picture", timeout=10
+        )
         if response.status_code == 200 and response.content:
             return response.content
         return False
@@ -124,8 +147,7 @@ class Backend:
         Returns:
             Union[bool, dict]: the users username if the request is successful, False otherwise
         """
-        endpoint = f"http://{self.ip}:{self.port}/users"
-        response = requests.get(url=f"{endpoint}/username", timeout=10)
+        response = self.session.get(url=self._base + "/users/username", timeout=10)
         if response.status_code == 200 and response.content:
             return response.json()
         return False
@@ -137,8 +159,7 @@ class Backend:
         Returns:
             Union[bool, dict]: the older messages if the request is successful, False otherwise
         """
-        endpoint = f"http://{self.ip}:{self.port}/messages/"
-        response = requests.get(url=endpoint, timeout=10)
+        response = self.session.get(url=self._messages_url, timeout=10)
         if response.status_code == 200 and response.content:
             return response.json()
         return False
@@ -162,15 +183,13 @@ class Backend:
         Returns:
             Union[None, dict]: the message if the request is successful, None otherwise
         """
-        endpoint = f"http://{self.ip}:{self.port}/messages/"
         data = {
             "sender": username,
             "receiver": receiver,
             "message": message,
             "response_id": response_id,
         }
-        header = {"Accept": "application/json"}
-        response = requests.post(url=endpoint, headers=header, json=data, timeout=10)
+        response = self.session.post(url=self._messages_url, json=data, timeout=10)
 
         return response.json() if response.status_code == 200 else None
 
@@ -185,9 +204,10 @@ class Backend:
         Returns:
             int: the status code
         """
-        # pylint: disable=line-too-long
-        endpoint = f"http://{self.ip}:{self.port}/messages/{message_id}/reaction/?new_reaction_nb={reaction_nb}"
-        response = requests.patch(url=endpoint, timeout=10)
+        endpoint = (
+            self._messages_url + f"{message_id}/reaction/?new_reaction_nb={reaction_nb}"
+        )
+        response = self.session.patch(url=endpoint, timeout=10)
         return response.status_code
 
     def update_is_readed_status(
@@ -205,6 +225,6 @@ class Backend:
             int: the status code
         """
         # pylint: disable=line-too-long
-        endpoint = f"http://{self.ip}:{self.port}/messages/readed/?sender={sender}&receiver={receiver}&is_readed={is_readed}"
-        response = requests.patch(url=endpoint, timeout=10)
+        endpoint = f"{self._messages_url}readed/?sender={sender}&receiver={receiver}&is_readed={is_readed}"
+        response = self.session.patch(url=endpoint, timeout=10)
         return response.status_code
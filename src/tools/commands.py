@@ -1,6 +1,7 @@
 """Module for TCP header commands"""
 
 from enum import Enum, unique
+from typing import Dict
 
 
 @unique
@@ -20,3 +21,7 @@ class Commands(Enum):
     ADD_REACT = 0x0005
     RM_REACT = 0x0006
     LAST_ID = 0x0007
+
+
+# Faster than Commands(value) on the per-frame path
+CMD_BY_INT: Dict[int, Commands] = {c.value: c for c in Commands}
@@ -1,40 +1,58 @@
 """Logger module"""
 
+import atexit
 import logging
 import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
 
 
-def setup_logger(logger_name: str) -> None:
+def setup_logger(logger_name: str) -> QueueListener:
     """
-    Setup the logger
+    Setup the logger, records are formatted and written by a listener thread
+
+    The level is INFO unless the LOG_LEVEL environment variable is set to a valid
+    level name (e.g. DEBUG)
 
     Args:
         logger_name (str): name of the logger
+
+    Returns:
+        QueueListener: the listener, stopped at exit. Processes ending without
+        atexit (e.g. multiprocessing children) must stop it to flush the records
     """
     logger = logging.getLogger()
-    logger.setLevel(logging.DEBUG)
+    level = os.environ.get("LOG_LEVEL", "INFO").upper()
+    valid_level = level in logging.getLevelNamesMapping()
+    logger.setLevel(level if valid_level else logging.INFO)
     formatter = logging.Formatter(
         "%(asctime)s - %(name)s - %(levelname)s - %(message)s (%(filename)s:%(lineno)d)"
     )
     # Update the log file
     file_handler = logging.FileHandler(os.path.join(os.getcwd(), logger_name))
-    _set_formatter(file_handler, formatter, logger)
+    _set_formatter(file_handler, formatter)
     # Update the console
     console_handler = logging.StreamHandler()
-    _set_formatter(console_handler, formatter, logger)
+    _set_formatter(console_handler, formatter)
+
+    # Logging threads only put the records in the queue
+    log_queue: queue.Queue = queue.Queue()
+    logger.addHandler(QueueHandler(log_queue))
+    listener = QueueListener(log_queue, file_handler, console_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    if not valid_level:
+        logging.warning("Unknown LOG_LEVEL %r, INFO is used", level)
+    return listener
 
 
-def _set_formatter(
-    handler: logging.Handler, formatter: logging.Formatter, logger: logging.Logger
-) -> None:
+def _set_formatter(handler: logging.Handler, formatter: logging.Formatter) -> None:
     """
     Set the formatter of a handler
 
     Args:
         handler (logging.Handler): the handler
         formatter (logging.Formatter): the formatter
-        logger (logging.Logger): the logger
     """
     handler.setLevel(logging.DEBUG)
     handler.setFormatter(formatter)
-    logger.addHandler(handler)
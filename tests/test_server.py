@@ -0,0 +1,330 @@
+"""Test the server module."""
+
+import errno
+import selectors
+import socket
+import threading
+import time
+from functools import partial
+
+import pytest
+
+from src.server import server as server_module
+from src.server.server import _parse, encode_frame
+from src.tools.commands import Commands
+
+SENDER = ("127.0.0.1", 50000)
+
+
+class FakeBackend:
+    """
+    Backend answering without any API, the first messages are the slowest
+    """
+
+    def __init__(self, ip: str, port: str):
+        self.ip = ip
+        self.port = port
+        self.messages = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.reactions = []
+        # Raised once by the next reaction update
+        self.reaction_error = None
+        self._lock = threading.Lock()
+
+    def send_message(self, username, receiver, message, response_id=None):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            message_id = len(self.messages) + 1
+            self.messages.append(message)
+        time.sleep(0.05 / message_id)
+        with self._lock:
+            self.in_flight -= 1
+        return {"message_id": message_id}
+
+    def update_reaction_nb(self, message_id, reaction_nb):
+        if error := self.reaction_error:
+            self.reaction_error = None
+            raise error
+        self.reactions.append((message_id, reaction_nb))
+        return 200
+
+
+@pytest.fixture(name="server")
+def fixture_server(monkeypatch):
+    """
+    Server without its event loop, the tests drive it from their own thread
+    """
+    monkeypatch.setattr(server_module, "Backend", FakeBackend)
+    monkeypatch.setattr(server_module.Server, "launch", lambda self: None)
+    server = server_module.Server("127.0.0.1", 0)
+    yield server
+    with pytest.raises(SystemExit):
+        server.close_connection()
+
+
+def _connect(server, addr):
+    """
+    Connect a client through a socket pair, return the socket of the client
+    """
+    conn, peer = socket.socketpair()
+    conn.setblocking(False)
+    server.sel.register(conn, selectors.EVENT_READ, partial(server._on_readable, addr))
+    server.handle_new_connection(addr, conn)
+    # Skip the CONN_NB frame sent to the new client
+    _recv_frames(peer, 1)
+    return conn, peer
+
+
+def _recv_frames(peer, count):
+    """
+    Receive count frames, return them with their newline
+    """
+    peer.settimeout(2)
+    data = b""
+    while data.count(b"\n") < count:
+        data += peer.recv(65536)
+    return data.splitlines(keepends=True)
+
+
+def _raw(cmd, payload):
+    """
+    Frame as received by the server or by the clients
+    """
+    return b"".join(encode_frame(cmd, payload))
+
+
+def _run_loop(server, addr):
+    """
+    Run the callbacks of the API calls until the frames of addr are sent
+    """
+    deadline = time.monotonic() + 2
+    while addr in server._pending:
+        assert time.monotonic() < deadline
+        server._wakeup_r.settimeout(0.1)
+        try:
+            server._wakeup_r.recv(1)
+        except socket.timeout:
+            continue
+        finally:
+            server._wakeup_r.setblocking(False)
+        server._run_ready(server._wakeup_r)
+
+
+def _wait_for(condition):
+    """
+    Wait until the condition, checked by another thread, is true
+    """
+    deadline = time.monotonic() + 2
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+@pytest.mark.parametrize(
+    "payload, expected",
+    [
+        ("alice:home:hello", ("alice", "home", "hello", None)),
+        ("al ice:bob:hi:12", ("alice", "bob", "hi", "12")),
+        ("alice:home:see: this", ("alice", "home", "see: this", None)),
+        ("alice:home:a:b:c", ("alice", "home", "a:b:c", None)),
+        ("alice:home:x:\u00b2", ("alice", "home", "x:\u00b2", None)),
+        ("alice:home:x:\u0661", ("alice", "home", "x:\u0661", None)),
+        ("alice:home", ("alice", "home", "", None)),
+    ],
+)
+def test_parse(payload, expected):
+    assert _parse(payload) == expected
+
+
+def test_read_data_split_frame(server):
+    conn, peer = _connect(server, SENDER)
+    frames = []
+    server.handle_frame = lambda addr, header, payload: frames.append((header, payload))
+    raw = _raw(Commands.MESSAGE, "alice:home:hello")
+
+    peer.sendall(raw[:5])
+    server._on_readable(SENDER, conn)
+    assert not frames
+    peer.sendall(raw[5:])
+    server._on_readable(SENDER, conn)
+
+    assert frames == [(Commands.MESSAGE.value, "alice:home:hello")]
+    assert server._rxstart[SENDER] == server._rxend[SENDER] == 0
+
+
+def test_read_data_packed_frames(server):
+    conn, peer = _connect(server, SENDER)
+    frames = []
+    server.handle_frame = lambda addr, header, payload: frames.append(payload)
+
+    peer.sendall(b"".join(_raw(Commands.MESSAGE, f"alice:home:{i}") for i in range(3)))
+    server._on_readable(SENDER, conn)
+
+    assert frames == ["alice:home:0", "alice:home:1", "alice:home:2"]
+
+
+def test_read_data_buffer_growth(server):
+    conn, peer = _connect(server, SENDER)
+    frames = []
+    server.handle_frame = lambda addr, header, payload: frames.append(payload)
+    message = "x" * (3 * server_module.RXBUF_SIZE)
+    raw = _raw(Commands.MESSAGE, f"alice:home:{message}")
+
+    peer.sendall(raw)
+    while not frames:
+        server._on_readable(SENDER, conn)
+
+    assert frames == [f"alice:home:{message}"]
+    # The buffer shrinks back once the big frame is handled
+    assert len(server._rxbuf[SENDER]) == server_module.RXBUF_SIZE
+
+
+def test_send_data_short_write(server):
+    conn, peer = _connect(server, SENDER)
+    conn.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+    first = encode_frame(Commands.MESSAGE, "alice:home:" + "a" * 200000)
+    second = encode_frame(Commands.MESSAGE, "alice:home:b")
+
+    server.send_data(conn, first)
+    assert conn in server._txbuf
+    assert server.sel.get_key(conn).events & selectors.EVENT_WRITE
+    # Queued behind the bytes not sent yet
+    server.send_data(conn, second)
+
+    expected = b"".join(first) + b"".join(second)
+    received = b""
+    peer.settimeout(2)
+    while len(received) < len(expected):
+        received += peer.recv(65536)
+        if conn in server._txbuf:
+            server._on_writable(conn)
+
+    assert received == expected
+    assert conn not in server._txbuf
+    assert server.sel.get_key(conn).events == selectors.EVENT_READ
+
+
+def test_flush_pending_order(server):
+    _, peer = _connect(server, SENDER)
+
+    for i in range(3):
+        server.handle_frame(SENDER, Commands.MESSAGE.value, f"alice:home:{i}")
+    server.handle_frame(SENDER, Commands.ADD_REACT.value, "alice:home:1;2")
+    _run_loop(server, SENDER)
+
+    assert _recv_frames(peer, 4) == [
+        _raw(Commands.MESSAGE, "1:alice:home:0"),
+        _raw(Commands.MESSAGE, "2:alice:home:1"),
+        _raw(Commands.MESSAGE, "3:alice:home:2"),
+        _raw(Commands.ADD_REACT, "alice:home:1;2"),
+    ]
+    assert server.backend.messages == ["0", "1", "2"]
+    assert server.backend.max_in_flight == 1
+
+
+def test_frame_without_api_call_sent_at_once(server):
+    _, peer = _connect(server, SENDER)
+
+    server.handle_frame(SENDER, Commands.ADD_REACT.value, "alice:home:1;2")
+
+    assert SENDER not in server._pending
+    assert _recv_frames(peer, 1) == [_raw(Commands.ADD_REACT, "alice:home:1;2")]
+
+
+def test_send_data_aborts_slow_reader(server, monkeypatch):
+    monkeypatch.setattr(server_module, "TXBUF_MAX_SIZE", 65536)
+    conn, _ = _connect(server, SENDER)
+    conn.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+    frame = encode_frame(Commands.MESSAGE, "alice:home:" + "a" * 16384)
+
+    # The peer never reads, the transmit buffer grows until the cap
+    while conn not in server._aborted:
+        server.send_data(conn, frame)
+
+    assert conn not in server._txbuf
+    assert server.sel.get_key(conn).events == selectors.EVENT_READ
+    # A write event already selected in the same batch is ignored
+    server._on_writable(conn)
+    server.send_data(conn, frame)
+    assert conn not in server._txbuf
+    # The read path disconnects the shut down socket
+    server._on_readable(SENDER, conn)
+    assert SENDER not in server.conn_dict
+    assert conn not in server._aborted
+
+
+class FailingSocket:
+    """
+    Listening socket whose accept raises the given errors, then has no client
+    """
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+
+    def accept(self):
+        if self.errors:
+            raise self.errors.pop(0)
+        raise BlockingIOError
+
+
+def test_accept_skips_failed_connection(server):
+    server._accept(FailingSocket(ConnectionAbortedError(), OSError(errno.EPROTO, "")))
+
+    assert server._accept_resume is None
+
+
+def test_accept_paused_without_memory(server):
+    server._accept(FailingSocket(OSError(errno.ENOMEM, "Cannot allocate memory")))
+
+    assert server._accept_resume is not None
+    with pytest.raises(KeyError):
+        server.sel.get_key(server.sock)
+
+
+def test_renamed_user_removed_on_disconnection(server):
+    conn, _ = _connect(server, SENDER)
+    server._register_user(SENDER, "alice")
+    server._register_user(SENDER, "alice2")
+
+    assert server.user_dict == {"alice2": SENDER}
+    server._display_disconnection(conn, SENDER)
+    assert not server.user_dict
+    assert not server.addr_to_user
+
+
+def test_stale_receiver_does_not_stop_sender_echo(server):
+    _, peer = _connect(server, SENDER)
+    # The receiver address is not connected anymore
+    server.user_dict["bob"] = ("127.0.0.1", 50001)
+
+    server.handle_frame(SENDER, Commands.ADD_REACT.value, "alice:bob:1;2")
+
+    assert _recv_frames(peer, 1) == [_raw(Commands.ADD_REACT, "alice:bob:1;2")]
+
+
+def test_reactions_coalesced(server):
+    _connect(server, SENDER)
+
+    for reaction_nb in range(1, 4):
+        server.handle_frame(
+            SENDER, Commands.ADD_REACT.value, f"alice:home:7;{reaction_nb}"
+        )
+    _wait_for(lambda: server.backend.reactions)
+    time.sleep(2 * server_module.REACTION_FLUSH_DELAY)
+
+    assert server.backend.reactions == [("7", "3")]
+
+
+def test_reaction_error_logged(server, caplog):
+    _connect(server, SENDER)
+    server.backend.reaction_error = ConnectionError("API down")
+
+    server.handle_frame(SENDER, Commands.ADD_REACT.value, "alice:home:7;1")
+    _wait_for(lambda: "API down" in caplog.text)
+    # The reaction thread is still running
+    server.handle_frame(SENDER, Commands.RM_REACT.value, "alice:home:7;0")
+    _wait_for(lambda: server.backend.reactions)
+
+    assert server.backend.reactions == [("7", "0")]